@@ -12,6 +12,11 @@ import math
 import numpy as np
 import cv2
 
+try:
+    from scipy import ndimage as _ndimage
+except Exception:  # scipy é opcional; sem ele o batch cai no caminho por amostra
+    _ndimage = None
+
 
 def compute_cm2_per_pixel(fov_deg: float, distance_cm: float, w_px: int, h_px: int) -> float:
     """Calcula cm^2 por pixel a partir de FOV horizontal (graus), distância em cm e resolução.
@@ -31,48 +36,85 @@ def compute_cm2_per_pixel(fov_deg: float, distance_cm: float, w_px: int, h_px: i
     return float(cm2_per_pixel)
 
 
-def process_frame(frame: np.ndarray, cm2_per_pixel: float = 0.0025, area_px_min: int = 20, area_px_max: int = 2000):
+# kernel de abertura criado uma vez (antes era um np.ones novo por frame)
+_OPEN_KERNEL = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+# pares de buffers de rascunho reutilizados por shape: blur/threshold/
+# morfologia escrevem via dst= em ping-pong, sem alocar HxW por frame
+_scratch = {}
+
+
+def _get_scratch(shape):
+    bufs = _scratch.get(shape)
+    if bufs is None:
+        bufs = (np.empty(shape, np.uint8), np.empty(shape, np.uint8))
+        _scratch[shape] = bufs
+    return bufs
+
+
+# contador de chamadas para o throttle do heatmap
+_frame_count = 0
+
+
+def process_frame(frame: np.ndarray, cm2_per_pixel: float = 0.0025, area_px_min: int = 20, area_px_max: int = 2000, heatmap_every: int = 30, gray: np.ndarray | None = None):
     """Processa um frame e detecta cracas por morfologia e contornos.
 
+    O heatmap só é gerado a cada `heatmap_every` chamadas (None nos demais
+    frames) — o preview do dashboard atualiza a ~1 Hz, não precisa de um
+    colormap novo a 30 FPS.
+
     Retorna: annotated_frame, cracas, fouling_percent, cracas_por_cm2, fouling_cm2, mask
     """
+    global _frame_count
     try:
         h, w = frame.shape[:2]
 
-        # Conversão e pré-processamento
-        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-        blur = cv2.GaussianBlur(gray, (7, 7), 0)
+        # Conversão e pré-processamento (pula se o caller já tem o gray)
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        buf_a, buf_b = _get_scratch(gray.shape)
+        cv2.GaussianBlur(gray, (7, 7), 0, dst=buf_a)
 
         # Detecção de regiões escuras/irregulares = cracas
-        _, mask = cv2.threshold(blur, 100, 255, cv2.THRESH_BINARY_INV)
+        cv2.threshold(buf_a, 100, 255, cv2.THRESH_BINARY_INV, dst=buf_b)
 
         # Remover ruído
-        kernel = np.ones((3, 3), np.uint8)
-        mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel, iterations=2)
+        mask = cv2.morphologyEx(buf_b, cv2.MORPH_OPEN, _OPEN_KERNEL, dst=buf_a, iterations=2)
 
-        # Encontrar contornos
-        contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+        # Componentes conexos: áreas e bounding boxes de todos os blobs numa
+        # única chamada C (sem loop Python por contorno)
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(mask, connectivity=8)
 
-        cracas = 0
         total_area = h * w
-        fouling_area = 0.0
 
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area_px_min < area < area_px_max:
-                cracas += 1
-                fouling_area += area
-                (x, y, rw, rh) = cv2.boundingRect(cnt)
-                cv2.rectangle(frame, (x, y), (x + rw, y + rh), (0, 0, 255), 1)
+        areas = stats[1:, cv2.CC_STAT_AREA]  # ignora o fundo (label 0)
+        keep = (areas > area_px_min) & (areas < area_px_max)
+        cracas = int(keep.sum())
+        fouling_area = float(areas[keep].sum())
+
+        # desenha só os retângulos aceitos pelo filtro de área
+        xs = stats[1:, cv2.CC_STAT_LEFT][keep]
+        ys = stats[1:, cv2.CC_STAT_TOP][keep]
+        ws = stats[1:, cv2.CC_STAT_WIDTH][keep]
+        hs = stats[1:, cv2.CC_STAT_HEIGHT][keep]
+        for x, y, rw, rh in zip(xs, ys, ws, hs):
+            cv2.rectangle(frame, (int(x), int(y)), (int(x + rw), int(y + rh)), (0, 0, 255), 1)
 
-        fouling_cm2 = fouling_area * cm2_per_pixel
+        # escala px -> cm^2 numa única multiplicação escalar (cm2_per_pixel
+        # é constante por execução, calibrado uma vez no parse da CLI)
+        fouling_cm2 = fouling_area * float(cm2_per_pixel)
 
         fouling_percent = (fouling_area / float(total_area)) * 100.0 if total_area > 0 else 0.0
         cracas_por_cm2 = cracas / max(fouling_cm2, 1e-9)
 
-        # gerar mapa de calor simples a partir da máscara (normalizado)
-        heat = cv2.normalize(mask, None, 0, 255, cv2.NORM_MINMAX)
-        heatmap = cv2.applyColorMap(heat.astype(np.uint8), cv2.COLORMAP_JET)
+        # gerar mapa de calor simples a partir da máscara (normalizado),
+        # em 1/4 da resolução e só a cada heatmap_every frames
+        heatmap = None
+        if heatmap_every and _frame_count % heatmap_every == 0:
+            small = cv2.resize(mask, (max(w // 4, 1), max(h // 4, 1)), interpolation=cv2.INTER_AREA)
+            heat = cv2.normalize(small, None, 0, 255, cv2.NORM_MINMAX)
+            heatmap = cv2.applyColorMap(heat.astype(np.uint8), cv2.COLORMAP_JET)
+        _frame_count += 1
 
         # Anotações de texto
         cv2.putText(frame, f"Cracas: {cracas}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 255), 2)
@@ -98,25 +140,72 @@ def count_cracas_from_mask(mask: np.ndarray, cm2_per_pixel: float = 0.0025, area
     """
     if mask is None:
         return 0, 0.0, 0.0
-    # ensure binary 0/255
-    m = mask.copy()
-    if m.dtype != np.uint8:
-        m = (m > 0).astype(np.uint8) * 255
+    # binariza sem copiar quando já é uint8: connectedComponentsWithStats não
+    # modifica a entrada, e qualquer valor não-zero já conta como foreground.
+    # Outros dtypes comparam antes de converter (astype direto truncaria
+    # frações 0..1 para zero e enrolaria negativos)
+    if mask.dtype == np.uint8:
+        m = mask
     else:
-        m = (m > 0).astype(np.uint8) * 255
+        m = (mask > 0).astype(np.uint8)
 
-    contours, _ = cv2.findContours(m, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-    cracas = 0
-    fouling_area = 0.0
-    for cnt in contours:
-        area = cv2.contourArea(cnt)
-        if area_px_min < area < area_px_max:
-            cracas += 1
-            fouling_area += area
+    _, _, stats, _ = cv2.connectedComponentsWithStats(m, connectivity=8)
+    areas = stats[1:, cv2.CC_STAT_AREA]
+    keep = (areas > area_px_min) & (areas < area_px_max)
+    cracas = int(keep.sum())
+    fouling_area = float(areas[keep].sum())
 
     fouling_cm2 = fouling_area * float(cm2_per_pixel)
     return int(cracas), float(fouling_area), float(fouling_cm2)
 
 
+def count_cracas_batch(masks: np.ndarray, cm2_per_pixel: float = 0.0025, area_px_min: int = 20, area_px_max: int = 2000):
+    """Versão em lote de count_cracas_from_mask para máscaras (B,H,W).
+
+    Um único scipy.ndimage.label no tensor inteiro: o elemento estruturante
+    só tem o plano central preenchido, não conecta amostras vizinhas do
+    batch, então os componentes saem separados por amostra numa só passada C.
+
+    Retorna (cracas[B], fouling_px[B], fouling_cm2[B]) como arrays.
+    """
+    masks = np.asarray(masks)
+    B = masks.shape[0]
+
+    if _ndimage is None:
+        # fallback sem scipy: uma chamada por amostra
+        cracas = np.zeros(B, dtype=np.int64)
+        fouling_px = np.zeros(B, dtype=np.float64)
+        for i in range(B):
+            c, px, _ = count_cracas_from_mask(masks[i], cm2_per_pixel, area_px_min, area_px_max)
+            cracas[i] = c
+            fouling_px[i] = px
+        return cracas, fouling_px, fouling_px * float(cm2_per_pixel)
+
+    # scipy exige estrutura com todas as dimensões == 3: o plano central
+    # dá a 8-conectividade e os planos externos zerados impedem que
+    # componentes atravessem amostras vizinhas do batch
+    structure = np.zeros((3, 3, 3), dtype=np.uint8)
+    structure[1] = 1
+    labels, n = _ndimage.label(masks > 0, structure=structure)
+    if n == 0:
+        zeros = np.zeros(B, dtype=np.float64)
+        return np.zeros(B, dtype=np.int64), zeros, zeros
+
+    areas = np.bincount(labels.ravel())[1:]  # área em px por componente
+
+    # a qual amostra pertence cada componente: scatter do índice do batch
+    # (todas as escritas de um mesmo label concordam, pois um componente
+    # nunca cruza amostras)
+    sample_grid = np.broadcast_to(np.arange(B)[:, None, None], labels.shape)
+    comp_sample = np.zeros(n + 1, dtype=np.int64)
+    comp_sample[labels] = sample_grid
+    comp_sample = comp_sample[1:]
+
+    keep = (areas > area_px_min) & (areas < area_px_max)
+    cracas = np.bincount(comp_sample[keep], minlength=B)
+    fouling_px = np.bincount(comp_sample[keep], weights=areas[keep], minlength=B)
+    return cracas, fouling_px, fouling_px * float(cm2_per_pixel)
+
+
 if __name__ == "__main__":
     print("Módulo barnacle_detector carregado. Use process_frame() a partir do seu agente.")
@@ -1,26 +1,89 @@
 import cv2
 import time
+import gzip
 import json
 import os
+import queue
+import threading
 from datetime import datetime
 
 import numpy as np
 
+try:
+    import numba
+    from numba import prange
+except Exception:  # numba é opcional; sem ele usamos o caminho OpenCV
+    numba = None
+    prange = range
 
-def compute_fake_fouling_metrics(frame):
+
+def _fused_metrics_kernel(bgr, thr):
+    """Luma + Sobel + soma de brilho num único sweep sobre os pixels.
+
+    Retorna (edge_density, brightness), ambos 0..1.
+    """
+    h = bgr.shape[0]
+    w = bgr.shape[1]
+    luma = np.empty((h, w), np.float32)
+    luma_sum = 0.0
+    for i in prange(h):
+        s = 0.0
+        for j in range(w):
+            v = 0.114 * bgr[i, j, 0] + 0.587 * bgr[i, j, 1] + 0.299 * bgr[i, j, 2]
+            luma[i, j] = v
+            s += v
+        luma_sum += s
+
+    edges = 0
+    for i in prange(1, h - 1):
+        e = 0
+        for j in range(1, w - 1):
+            gx = (luma[i - 1, j + 1] - luma[i - 1, j - 1]
+                  + 2.0 * (luma[i, j + 1] - luma[i, j - 1])
+                  + luma[i + 1, j + 1] - luma[i + 1, j - 1])
+            gy = (luma[i + 1, j - 1] - luma[i - 1, j - 1]
+                  + 2.0 * (luma[i + 1, j] - luma[i - 1, j])
+                  + luma[i + 1, j + 1] - luma[i - 1, j + 1])
+            if abs(gx) + abs(gy) > thr:
+                e += 1
+        edges += e
+
+    edge_density = edges / float(h * w)
+    brightness = luma_sum / (255.0 * h * w)
+    return edge_density, brightness
+
+
+if numba is not None:
+    _fused_metrics_kernel = numba.njit(parallel=True, fastmath=True, cache=True)(
+        _fused_metrics_kernel
+    )
+
+
+def compute_fake_fouling_metrics(frame, gray=None):
     """
     Aqui entra SUA IA de biofouling depois (U-Net, etc).
     Por enquanto, é só uma lógica de exemplo para ter algo rodando.
+
+    `gray` opcional: reaproveita uma conversão BGR2GRAY já feita pelo caller.
     """
 
-    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+    if numba is not None:
+        # kernel fundido: uma passada paralela em vez de cvtColor + Canny + 2 means
+        edge_density, brightness = _fused_metrics_kernel(frame, 200.0)
+        edge_density = float(edge_density)
+        brightness = float(brightness)
+    else:
+        if gray is None:
+            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
 
-    # "Rugosidade" simples com bordas Canny (proxy de incrustação)
-    edges = cv2.Canny(gray, 100, 200)
-    edge_density = float(np.mean(edges > 0))  # 0 a 1
+        # "Rugosidade" simples com bordas Canny (proxy de incrustação);
+        # countNonZero/cv2.mean: reduções C de passada única, sem o
+        # temporário booleano de np.mean(edges > 0)
+        edges = cv2.Canny(gray, 100, 200)
+        edge_density = cv2.countNonZero(edges) / edges.size  # 0 a 1
 
-    # Brilho médio (só pra enriquecer as features)
-    brightness = float(np.mean(gray) / 255.0)  # 0 a 1
+        # Brilho médio (só pra enriquecer as features)
+        brightness = cv2.mean(gray)[0] / 255.0  # 0 a 1
 
     # Fouling index fake (ajuste depois com seu modelo)
     fouling_index = edge_density * (1.0 - brightness)
@@ -60,16 +123,35 @@ def main():
 
     print("🎥 Lendo câmera em tempo quase real. CTRL+C para parar.")
 
-    frame_id = 0
+    # Pipeline: captura (T1) -> métricas (T2) -> JSON/preview (thread principal).
+    # Filas maxsize=2 (double-buffer) dão back-pressure: a captura não
+    # acumula frames na frente do cálculo de métricas.
+    read_q = queue.Queue(maxsize=2)
+    write_q = queue.Queue(maxsize=2)
+    stop_event = threading.Event()
 
-    try:
-        while True:
+    def etapa_captura():
+        while not stop_event.is_set():
             ret, frame = cap.read()
             if not ret:
                 print("Falha ao capturar frame.")
                 time.sleep(1)
                 continue
+            try:
+                read_q.put(frame, timeout=0.5)
+            except queue.Full:
+                continue  # descarta quando o pipeline está cheio
+        try:
+            read_q.put_nowait(None)  # sentinela
+        except queue.Full:
+            pass
 
+    def etapa_metricas():
+        frame_id = 0
+        while not stop_event.is_set():
+            frame = read_q.get()
+            if frame is None:
+                break
             frame_id += 1
 
             metrics = compute_fake_fouling_metrics(frame)
@@ -79,25 +161,109 @@ def main():
                 "frame_id": frame_id,
                 "metrics": metrics,
             }
+            try:
+                write_q.put((payload, frame), timeout=1.0)
+            except queue.Full:
+                continue
+        try:
+            write_q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    # Writer em background: historico NDJSON comprimido (gzip nivel 1,
+    # flush a cada ~100 ms) + snapshot "latest" atomico (os.replace).
+    json_q = queue.Queue()
+    metrics_log_path = os.path.join(data_dir, "camera_metrics.ndjson.gz")
+
+    def etapa_json():
+        tmp_path = metrics_path + ".tmp"
+        flush_deadline = 0.0
+        snapshot_deadline = 0.0
+        with gzip.open(metrics_log_path, "at", compresslevel=1, encoding="utf-8") as log:
+            while True:
+                payload = json_q.get()
+                if payload is None:
+                    break
+                json.dump(payload, log, ensure_ascii=False, separators=(",", ":"))
+                log.write("\n")
+                agora = time.monotonic()
+                if agora >= flush_deadline:
+                    log.flush()
+                    flush_deadline = agora + 0.1
+                if agora >= snapshot_deadline:
+                    with open(tmp_path, "w", encoding="utf-8") as f:
+                        json.dump(payload, f, ensure_ascii=False, separators=(",", ":"))
+                    os.replace(tmp_path, metrics_path)
+                    snapshot_deadline = agora + 0.25
 
-            # Salva para o dashboard consumir
-            with open(metrics_path, "w", encoding="utf-8") as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
+    # Preview em thread propria de UI: fila maxsize=1 com drop-latest,
+    # para o imshow/waitKey nunca segurar o pipeline de métricas.
+    ui_q = queue.Queue(maxsize=1)
 
+    def _ui_put(frame):
+        try:
+            ui_q.put_nowait(frame)
+        except queue.Full:
+            try:
+                ui_q.get_nowait()  # descarta o frame antigo
+            except queue.Empty:
+                pass
+            try:
+                ui_q.put_nowait(frame)
+            except queue.Full:
+                pass
+
+    def etapa_ui():
+        while not stop_event.is_set():
+            try:
+                frame = ui_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
             # Mostra um preview simples da câmera (opcional)
             cv2.imshow("Camera HullGuard (preview local)", frame)
             if cv2.waitKey(1) & 0xFF == ord("q"):
+                stop_event.set()
+                break
+        cv2.destroyAllWindows()
+
+    t_captura = threading.Thread(target=etapa_captura, daemon=True)
+    t_metricas = threading.Thread(target=etapa_metricas, daemon=True)
+    t_json = threading.Thread(target=etapa_json, daemon=True)
+    t_ui = threading.Thread(target=etapa_ui, daemon=True)
+    t_captura.start()
+    t_metricas.start()
+    t_json.start()
+    t_ui.start()
+
+    # Estágio final na thread principal: repassa payloads ao writer e
+    # frames à UI — sem I/O de disco nem GUI aqui.
+    try:
+        while not stop_event.is_set():
+            try:
+                item = write_q.get(timeout=1.0)
+            except queue.Empty:
+                if not t_metricas.is_alive():
+                    break
+                continue
+            if item is None:
                 break
+            payload, frame = item
 
-            # Intervalo entre medições (ajuste pra ficar mais "tempo real")
-            time.sleep(1.0)
+            json_q.put(payload)
+            _ui_put(frame)
 
     except KeyboardInterrupt:
         print("\nEncerrando agente de câmera...")
 
     finally:
+        stop_event.set()
+        json_q.put(None)
+        t_json.join(timeout=2.0)
+        t_ui.join(timeout=2.0)
+        # espera a captura sair do cap.read() antes do release: liberar a
+        # câmera com um read concorrente pode abortar o processo
+        t_captura.join(timeout=2.0)
         cap.release()
-        cv2.destroyAllWindows()
 
 
 if __name__ == "__main__":
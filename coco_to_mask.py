@@ -9,7 +9,10 @@ Uso:
 """
 from __future__ import annotations
 import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import cv2
 import numpy as np
 from PIL import Image
 
@@ -26,42 +29,66 @@ def ensure_dir(p: Path):
     p.mkdir(parents=True, exist_ok=True)
 
 
+def _process_one(job):
+    """Rasteriza e salva a máscara de uma imagem (roda num worker do pool)."""
+    img_info, anns, out_dir, classes_of_interest = job
+    file_name = img_info["file_name"]
+    height, width = img_info.get("height"), img_info.get("width")
+    mask = np.zeros((height, width), dtype=np.uint8)
+
+    # polígonos rasterizados direto com cv2.fillPoly (uma chamada por
+    # imagem), sem o round-trip frPyObjects/decode por anotação
+    polys = []
+    for ann in anns:
+        cat_id = ann.get("category_id")
+        if classes_of_interest and cat_id not in classes_of_interest:
+            continue
+        # rle or segmentation
+        seg = ann.get("segmentation")
+        if seg is None:
+            continue
+        if isinstance(seg, list):
+            polys.extend(
+                np.asarray(p, dtype=np.int32).reshape(-1, 2) for p in seg if len(p) >= 6
+            )
+        else:
+            # RLE: único caso que ainda precisa do pycocotools
+            m = mask_utils.decode(seg)
+            if m.ndim == 3:
+                m = np.any(m, axis=2)
+            mask[m > 0] = 1
+    if polys:
+        cv2.fillPoly(mask, polys, 1)
+
+    out_mask_path = Path(out_dir) / f"{Path(file_name).stem}_mask.png"
+    Image.fromarray((mask * 255).astype(np.uint8)).save(out_mask_path)
+    return str(out_mask_path)
+
+
 def coco_to_masks(coco_json: str, images_dir: str, out_dir: str, classes_of_interest: list[int] | None = None):
     coco = COCO(coco_json)
     ensure_dir(Path(out_dir))
 
-    img_ids = coco.getImgIds()
-    for img_id in img_ids:
+    # monta jobs picklaveis (dicts puros) e despacha cada imagem para um
+    # worker — cada uma é independente das demais
+    jobs = []
+    for img_id in coco.getImgIds():
         img_info = coco.loadImgs(img_id)[0]
-        file_name = img_info["file_name"]
-        img_path = Path(images_dir) / file_name
+        img_path = Path(images_dir) / img_info["file_name"]
         if not img_path.exists():
             print(f"Aviso: imagem não encontrada {img_path}, pulando")
             continue
-
-        height, width = img_info.get("height"), img_info.get("width")
-        mask = np.zeros((height, width), dtype=np.uint8)
-
-        ann_ids = coco.getAnnIds(imgIds=img_id)
-        anns = coco.loadAnns(ann_ids)
-        for ann in anns:
-            cat_id = ann.get("category_id")
-            if classes_of_interest and cat_id not in classes_of_interest:
-                continue
-            # rle or segmentation
-            seg = ann.get("segmentation")
-            if seg is None:
-                continue
-            rle = mask_utils.frPyObjects(seg, height, width)
-            m = mask_utils.decode(rle)
-            if m.ndim == 3:
-                m = np.any(m, axis=2)
-            # set mask pixels to 1 (or category id if multiple classes desired)
-            mask[m > 0] = 1
-
-        out_mask_path = Path(out_dir) / f"{Path(file_name).stem}_mask.png"
-        Image.fromarray((mask * 255).astype(np.uint8)).save(out_mask_path)
-        print(f"Salvo máscara: {out_mask_path}")
+        anns = coco.loadAnns(coco.getAnnIds(imgIds=img_id))
+        jobs.append((img_info, anns, out_dir, classes_of_interest))
+
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            for saved in ex.map(_process_one, jobs):
+                print(f"Salvo máscara: {saved}")
+    except Exception as e:
+        print(f"Pool de processos indisponível ({e}), convertendo em série")
+        for job in jobs:
+            print(f"Salvo máscara: {_process_one(job)}")
 
 
 def main():
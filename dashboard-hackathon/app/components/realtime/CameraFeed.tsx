@@ -26,6 +26,8 @@ export default function CameraFeed({ onDataUpdate }: Props) {
   const [cracasPoints, setCracasPoints] = useState<Array<{ x: number; y: number }>>([]);
   const [igiHistory, setIgiHistory] = useState<number[]>([]);
   const wsRef = useRef<WebSocket | null>(null);
+  // true entre o JSON com mask_binary e o frame binário (PNG) que o segue
+  const expectMaskRef = useRef<boolean>(false);
   const [status, setStatus] = useState("Aguardando câmera");
   const [igi, setIgi] = useState<number | null>(null);
   const [confidence, setConfidence] = useState<number | null>(null);
@@ -110,8 +112,22 @@ export default function CameraFeed({ onDataUpdate }: Props) {
         setStatus("Conectado ao servidor IA");
       };
       ws.onmessage = (ev) => {
+        // frames binários: o servidor envia a máscara como PNG cru logo
+        // após o JSON que anuncia mask_binary
+        if (ev.data instanceof Blob) {
+          if (expectMaskRef.current) {
+            expectMaskRef.current = false;
+            const reader = new FileReader();
+            reader.onloadend = () => {
+              if (typeof reader.result === "string") setMaskPreview(reader.result);
+            };
+            reader.readAsDataURL(ev.data);
+          }
+          return;
+        }
         try {
           const j = JSON.parse(ev.data);
+          expectMaskRef.current = j.mask_binary === true;
           if (typeof j.igi === "number") {
             setIgi(j.igi);
             setCoverage(j.coverage ?? null);
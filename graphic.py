@@ -1,13 +1,18 @@
 import pandas as pd
 import matplotlib.pyplot as plt
 
-df = pd.read_csv("./Dados AIS frota TP/THIAGO FERNANDES.csv")
+# lê só as colunas usadas e já parseia a data no próprio read_csv
+df = pd.read_csv(
+    "./Dados AIS frota TP/THIAGO FERNANDES.csv",
+    usecols=["DATAHORA", "LATITUDE", "LONGITUDE", "NOME"],
+    parse_dates=["DATAHORA"],
+)
 
-df["DATAHORA"] = pd.to_datetime(df["DATAHORA"])
-df = df.sort_values("DATAHORA")
+# mergesort: estável e mais rápido em dados já quase ordenados por tempo
+df = df.sort_values("DATAHORA", kind="mergesort")
 
 plt.figure(figsize=(10,6))
-plt.plot(df["LONGITUDE"], df["LATITUDE"], marker='o')
+plt.plot(df["LONGITUDE"].to_numpy(), df["LATITUDE"].to_numpy(), marker='o')
 plt.xlabel("Longitude")
 plt.ylabel("Latitude")
 plt.title(f"Rota do Navio - {df['NOME'].iloc[0]}")
@@ -8,21 +8,24 @@ from __future__ import annotations
 
 import argparse
 import time
+import gzip
 import json
 import os
+import queue
+import threading
 from datetime import datetime
 from pathlib import Path
 
 import cv2
 import numpy as np
-from PIL import Image
 
 import torch
 import torch.nn.functional as F
 
 from train_unet import SimpleUNet
-from vision_utils import apply_frequency_bandpass, compute_fouling_from_mask
+from vision_utils import compute_fouling_from_mask
 from barnacle_detector import process_frame as barnacle_process_frame, compute_cm2_per_pixel
+from camera_agent import compute_fake_fouling_metrics
 
 
 def load_model(path: str, requested_in_channels=3, device=None):
@@ -70,22 +73,81 @@ def load_model(path: str, requested_in_channels=3, device=None):
         model.load_state_dict(state, strict=False)
     model.to(device)
     model.eval()
+    # channels-last + FP16 na GPU: metade dos bytes por tensor, conv mais rapida
+    model = model.to(memory_format=torch.channels_last)
+    if device.type == 'cuda':
+        model = model.half()
+    try:
+        model = torch.compile(model, mode='reduce-overhead')
+    except Exception:
+        pass  # torch antigo sem torch.compile
     return model, device, model_in_ch
 
 
+# Buffer de staging reutilizado em memoria pinned: com ele o
+# .to(device, non_blocking=True) vira copia H2D assincrona de verdade
+# (memoria pageable forca a copia sincrona) e evita alocar um tensor novo
+# por frame.
+_pin_staging = None
+
+# Buffer float32 preallocado para a normalizacao /255 (evita ~4 temporarios
+# por frame do caminho antigo via PIL)
+_float_buf = None
+
+# Mascara anular do bandpass em frequencia, pre-computada uma vez por shape
+_freq_mask = None
+
+
+def _make_rfft_annulus(h, w, low_ratio, high_ratio):
+    """Mascara passa-banda para torch.fft.rfft2 (mesmos cortes relativos do
+    antigo apply_frequency_bandpass em numpy)."""
+    fy = torch.fft.fftfreq(h).reshape(-1, 1)
+    fx = torch.fft.rfftfreq(w).reshape(1, -1)
+    dist = torch.sqrt(fy * fy + fx * fx)
+    max_dist = 0.5 ** 0.5  # canto da grade de frequencias normalizada
+    low = low_ratio * max_dist
+    high = high_ratio * max_dist
+    return ((dist >= low) & (dist <= high)).float()
+
+
 def preprocess_frame(frame: np.ndarray, size=(256,256), use_freq=False):
     # frame: BGR uint8
-    rgb = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    pil = Image.fromarray(rgb)
-    pil = pil.resize(size)
-    arr = np.array(pil).astype(np.float32) / 255.0
-    tensor = torch.from_numpy(arr).permute(2,0,1).unsqueeze(0).float()
+    # cascata pyrDown para razões de downscale >= 2x (filtro separável de
+    # 5 taps, SIMD): cada passo corta 4x os dados antes do resize final
+    resized = frame
+    while resized.shape[0] >= 2 * size[1] and resized.shape[1] >= 2 * size[0]:
+        resized = cv2.pyrDown(resized)
+    resized = cv2.resize(resized, tuple(size), interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(resized, cv2.COLOR_BGR2RGB)
+
+    global _float_buf
+    if _float_buf is None or _float_buf.shape != rgb.shape:
+        _float_buf = np.empty(rgb.shape, dtype=np.float32)
+    np.multiply(rgb, 1.0 / 255.0, out=_float_buf, dtype=np.float32)
+    tensor = torch.from_numpy(_float_buf).permute(2,0,1).unsqueeze(0)
 
     if use_freq:
-        freq = apply_frequency_bandpass(np.array(pil).mean(axis=2).astype(np.float32), low_ratio=0.01, high_ratio=0.5)
-        freq = (freq / 255.0)[None, ...]
-        freq_t = torch.from_numpy(freq).unsqueeze(0).float()
-        tensor = torch.cat([tensor, freq_t], dim=1)
+        # bandpass direto em torch.fft.rfft2 com mascara pre-computada:
+        # sem FFT numpy nem temporarios complexos de 128 bits por frame
+        global _freq_mask
+        g = tensor.mean(1, keepdim=True)
+        h, w = g.shape[-2:]
+        if _freq_mask is None or _freq_mask.shape != (h, w // 2 + 1):
+            _freq_mask = _make_rfft_annulus(h, w, 0.01, 0.5)
+        g_bp = torch.fft.irfft2(torch.fft.rfft2(g) * _freq_mask, s=(h, w))
+        mn, mx = g_bp.amin(), g_bp.amax()
+        if float(mx - mn) > 1e-6:
+            g_bp = (g_bp - mn) / (mx - mn)
+        else:
+            g_bp = g
+        tensor = torch.cat([tensor, g_bp], dim=1)
+
+    if torch.cuda.is_available():
+        global _pin_staging
+        if _pin_staging is None or _pin_staging.shape != tensor.shape:
+            _pin_staging = torch.empty_like(tensor, pin_memory=True)
+        _pin_staging.copy_(tensor)
+        return _pin_staging
 
     return tensor
 
@@ -137,21 +199,62 @@ def main():
             print('Falha ao calcular cm2_per_pixel:', e)
 
     print('Iniciando inferencia em tempo real. q para sair.')
-    frame_id = 0
-    try:
-        while True:
+
+    # Pipeline em 3 estágios: captura (T1) -> inferência (T2) -> JSON/exibição
+    # (thread principal). Filas maxsize=2 fazem double-buffer com back-pressure:
+    # a captura não dispara na frente da inferência, e o FPS em regime vira
+    # 1/max(estágio) em vez da soma dos estágios.
+    read_q = queue.Queue(maxsize=2)
+    write_q = queue.Queue(maxsize=2)
+    stop_event = threading.Event()
+
+    def etapa_captura():
+        while not stop_event.is_set():
             ret, frame = cap.read()
             if not ret:
                 time.sleep(0.5)
                 continue
+            try:
+                read_q.put(frame, timeout=0.5)
+            except queue.Full:
+                continue  # pipeline cheio: descarta o frame mais antigo não lido
+        try:
+            read_q.put_nowait(None)  # sentinela de encerramento
+        except queue.Full:
+            pass
+
+    def etapa_inferencia():
+        frame_id = 0
+        # anel de buffers persistentes: o buffer enfileirado pode ainda estar
+        # sendo renderizado pela UI, então write_q (2) + UI (1) + o frame em
+        # anotação (1) precisam de buffers distintos
+        overlay_bufs = []
+        overlay_idx = 0
+        while not stop_event.is_set():
+            frame = read_q.get()
+            if frame is None:
+                break
             frame_id += 1
 
             metrics = None
             mask_vis = None
 
+            # gray convertido uma única vez por frame e compartilhado com
+            # os caminhos que precisam dele
+            gray = None
+            if args.use_barnacle or model is None:
+                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+
             # If requested, run barnacle detector (morphology-based)
             if args.use_barnacle:
-                annotated, cracas, fouling_percent, cracas_por_cm2, fouling_cm2, mask, heatmap = barnacle_process_frame(frame.copy(), cm2_per_pixel=cm2_per_pixel)
+                # copia para o próximo buffer do anel em vez de frame.copy():
+                # mesma banda de memoria, zero pressao no alocador
+                if not overlay_bufs or overlay_bufs[0].shape != frame.shape:
+                    overlay_bufs = [np.empty_like(frame) for _ in range(4)]
+                overlay_buf = overlay_bufs[overlay_idx]
+                overlay_idx = (overlay_idx + 1) % len(overlay_bufs)
+                np.copyto(overlay_buf, frame)
+                annotated, cracas, fouling_percent, cracas_por_cm2, fouling_cm2, mask, heatmap = barnacle_process_frame(overlay_buf, cm2_per_pixel=cm2_per_pixel, gray=gray)
                 # build metrics
                 metrics = {
                     'method': 'barnacle_detector',
@@ -163,10 +266,13 @@ def main():
                 overlay = annotated
             elif model is not None:
                 tensor = preprocess_frame(frame, size=tuple(args.size), use_freq=effective_use_freq)
-                tensor = tensor.to(device)
-                with torch.no_grad():
+                tensor = tensor.to(device, memory_format=torch.channels_last, non_blocking=True)
+                if device.type == 'cuda':
+                    tensor = tensor.half()
+                with torch.inference_mode(), torch.autocast(device.type, dtype=torch.float16,
+                                                            enabled=(device.type == 'cuda')):
                     logits = model(tensor)
-                    probs = torch.sigmoid(logits)[0,0].cpu().numpy()
+                    probs = torch.sigmoid(logits)[0,0].float().cpu().numpy()
                     mask = (probs > 0.5).astype(np.uint8)
                     fouling = compute_fouling_from_mask(mask)
                     metrics = {
@@ -180,17 +286,13 @@ def main():
                     colored = cv2.applyColorMap(mask_vis, cv2.COLORMAP_JET)
                     overlay = cv2.addWeighted(frame, 0.6, colored, 0.4, 0)
             else:
-                # fake heuristic (edge density)
-                gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-                edges = cv2.Canny(gray, 100,200)
-                edge_density = float(np.mean(edges>0))
-                brightness = float(np.mean(gray)/255.0)
-                fouling_index = edge_density * (1.0 - brightness)
+                # fake heuristic: kernel fundido do camera_agent (numba quando disponivel)
+                fake = compute_fake_fouling_metrics(frame, gray=gray)
                 metrics = {
                     'method': 'heuristic',
-                    'fouling_index': float(fouling_index),
-                    'edge_density': float(edge_density),
-                    'brightness': float(brightness)
+                    'fouling_index': float(fake['fouling_index']),
+                    'edge_density': float(fake['edge_density']),
+                    'brightness': float(fake['brightness'])
                 }
                 overlay = frame
 
@@ -199,26 +301,114 @@ def main():
                 'frame_id': frame_id,
                 'metrics': metrics,
             }
-            # save metrics
-            with open(metrics_path, 'w', encoding='utf-8') as f:
-                json.dump(payload, f, ensure_ascii=False, indent=2)
-
-            # show
-            if model is not None and mask_vis is not None:
-                cv2.imshow('HullGuard - infer', overlay)
-            else:
-                cv2.imshow('HullGuard - infer (fake)', overlay)
-
+            try:
+                write_q.put((payload, overlay, mask_vis), timeout=1.0)
+            except queue.Full:
+                continue
+        try:
+            write_q.put_nowait(None)
+        except queue.Full:
+            pass
+
+    # Writer em background: historico append-only em NDJSON (encoder compacto,
+    # buffer de 64 KB, flush a cada ~100 ms) e snapshot "latest" para o
+    # dashboard reescrito atomicamente via os.replace a cada 0.5 s.
+    json_q = queue.Queue()
+    metrics_log_path = data_dir / 'camera_metrics.ndjson.gz'
+
+    def etapa_json():
+        tmp_path = str(metrics_path) + '.tmp'
+        flush_deadline = 0.0
+        snapshot_deadline = 0.0
+        # compresslevel=1: compressao leve ja encolhe >=10x o log em texto
+        with gzip.open(metrics_log_path, 'at', compresslevel=1, encoding='utf-8') as log:
+            while True:
+                payload = json_q.get()
+                if payload is None:
+                    break
+                json.dump(payload, log, ensure_ascii=False, separators=(',', ':'))
+                log.write('\n')
+                agora = time.monotonic()
+                if agora >= flush_deadline:
+                    log.flush()
+                    flush_deadline = agora + 0.1
+                if agora >= snapshot_deadline:
+                    with open(tmp_path, 'w', encoding='utf-8') as f:
+                        json.dump(payload, f, ensure_ascii=False, separators=(',', ':'))
+                    os.replace(tmp_path, metrics_path)
+                    snapshot_deadline = agora + 0.25
+
+    # UI em thread propria: imshow/waitKey podem bloquear um vsync inteiro
+    # em algumas plataformas; fila maxsize=1 com drop-latest garante que a
+    # GUI nunca segura o pipeline de inferencia.
+    ui_q = queue.Queue(maxsize=1)
+
+    def _ui_put(item):
+        try:
+            ui_q.put_nowait(item)
+        except queue.Full:
+            try:
+                ui_q.get_nowait()  # descarta o frame antigo
+            except queue.Empty:
+                pass
+            try:
+                ui_q.put_nowait(item)
+            except queue.Full:
+                pass
+
+    def etapa_ui():
+        while not stop_event.is_set():
+            try:
+                title, img = ui_q.get(timeout=0.2)
+            except queue.Empty:
+                continue
+            cv2.imshow(title, img)
             if cv2.waitKey(1) & 0xFF == ord('q'):
+                stop_event.set()
                 break
+        cv2.destroyAllWindows()
 
-            time.sleep(0.5)
+    t_captura = threading.Thread(target=etapa_captura, daemon=True)
+    t_inferencia = threading.Thread(target=etapa_inferencia, daemon=True)
+    t_json = threading.Thread(target=etapa_json, daemon=True)
+    t_ui = threading.Thread(target=etapa_ui, daemon=True)
+    t_captura.start()
+    t_inferencia.start()
+    t_json.start()
+    t_ui.start()
+
+    # Estágio 3 (thread principal): despacha payloads para o writer e
+    # frames para a UI, sem I/O nem GUI aqui.
+    try:
+        while not stop_event.is_set():
+            try:
+                item = write_q.get(timeout=1.0)
+            except queue.Empty:
+                if not t_inferencia.is_alive():
+                    break
+                continue
+            if item is None:
+                break
+            payload, overlay, mask_vis = item
+
+            json_q.put(payload)
+
+            if model is not None and mask_vis is not None:
+                _ui_put(('HullGuard - infer', overlay))
+            else:
+                _ui_put(('HullGuard - infer (fake)', overlay))
 
     except KeyboardInterrupt:
         print('\nSaindo...')
     finally:
+        stop_event.set()
+        json_q.put(None)
+        t_json.join(timeout=2.0)
+        t_ui.join(timeout=2.0)
+        # espera a captura sair do cap.read() antes do release: liberar a
+        # câmera com um read concorrente pode abortar o processo
+        t_captura.join(timeout=2.0)
         cap.release()
-        cv2.destroyAllWindows()
 
 
 if __name__ == '__main__':
@@ -13,6 +13,8 @@ import os
 import cv2 as cv
 import json
 import pycocotools
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image
 
 __author__ = "K. Kamzelis, G. Chliveros, and I. Tzanetatos"
 __copyright__ = "Copyright 2019, WatchOver Project"
@@ -22,49 +24,49 @@ __maintainer__ = "Tzanetatos / Chliveros"
 __email__ = "mech-tech@mitropolitiko.edu.gr"
 
 def _loadData(path):
-    
-    imgs = []
+
+    # Apenas lista os caminhos; a decodificacao acontece nos workers,
+    # uma imagem por vez
+    paths = []
     ids = []
-    
+
     for img in os.listdir(path):
         if img.endswith(".jpg"):
-            imgs.append(cv.imread(os.path.join(path, img)))
-            
+            paths.append(os.path.join(path, img))
+
             ids.append(img)
-    
-    return imgs, ids
 
-def _images(img, path, ids):
-    
-    
+    return paths, ids
+
+def _images(path, ids):
+
+    # le so o header do arquivo (PIL nao decodifica os pixels aqui);
+    # evita carregar a imagem raw inteira em memoria
+    with Image.open(os.path.join(path, ids)) as im:
+        width, height = im.size
+
     img = { "id" : ids[:-3],
            "url" : "http://dx.doi.org/10.17632/ry392rp8cj.1",
-           "width" : img.shape[1],
-           "height" : img.shape[0],
+           "width" : width,
+           "height" : height,
            "file_name" : ids,
            "path" : os.path.join(path, ids)}
-    
+
     return img
 
 def _annotations(img, ids, anId, catId=1):
     
    
-    # Ensure label is binary
-    label = np.where(img[:,:,0] > 0, np.uint8(1), np.uint8(0))
-    
-    encMask = np.where(img[:, :, :] > 0, np.uint8(1), np.uint8(0))
-    encMask = np.asfortranarray(encMask)
-    
+    # Ensure label is binary (um canal basta: os tres sao identicos)
+    if img.ndim == 3:
+        img = img[:, :, 0]
+    label = (img > 0).astype(np.uint8)
+
     area = img.shape[0] * img.shape[1] - np.sum(label)
-    
-    # counts = _mask2rle(encMask)
-    rle = pycocotools.mask.encode(encMask)
-    
-    if type(rle) is list:
-        for i in range(len(rle)):
-            rle[i]['counts'] = rle[i]['counts'].decode("utf-8")
-    else:
-        rle['counts'] = rle['counts'].decode('ascii-8')
+
+    # encode de canal unico devolve um dict direto (sem lista por canal)
+    rle = pycocotools.mask.encode(np.asfortranarray(label))
+    rle['counts'] = rle['counts'].decode('ascii')
     
     annot = {"id" : anId,
              "category_id" : catId,
@@ -75,9 +77,19 @@ def _annotations(img, ids, anId, catId=1):
     
     return annot
 
-def _cocoAnnot(imgs, labels, path, ids):
-    
-    
+def _processOne(job):
+
+    # worker: decodifica so o label (um por vez, liberado em seguida) e
+    # devolve os fragmentos JSON prontos; do raw basta o header
+    rawPath, labelPath, path, name, anId = job
+
+    label = cv.imread(labelPath, cv.IMREAD_GRAYSCALE)
+
+    return _images(path, name), _annotations(label, name, anId)
+
+def _cocoAnnot(rawPaths, labelPaths, path, ids):
+
+
     annotations = {"info":
                    {"description": "MaVeCoDD Dataset: Marine Vessel Hull Corrosion in Dry-Dock Images",
                    "url" : "http://dx.doi.org/10.17632/ry392rp8cj.1",
@@ -94,12 +106,23 @@ def _cocoAnnot(imgs, labels, path, ids):
              "id" : 1}]
         }
     
-    for i in range(len(imgs)):
-        
-        annotations["images"].append(_images(imgs[i], path, ids[i]))
-        
-        annotations["annotations"].append(_annotations(labels[i], ids[i], anId=int(i+1e6)))
-    
+    jobs = [(rawPaths[i], labelPaths[i], path, ids[i], int(i + 1e6))
+            for i in range(len(ids))]
+
+    # cada imagem e independente: despacha para um pool de processos,
+    # com fallback serial caso o pool nao esteja disponivel
+    try:
+        with ProcessPoolExecutor(max_workers=os.cpu_count()) as ex:
+            results = list(ex.map(_processOne, jobs))
+    except Exception:
+        results = [_processOne(job) for job in jobs]
+
+    for imgEntry, annotEntry in results:
+
+        annotations["images"].append(imgEntry)
+
+        annotations["annotations"].append(annotEntry)
+
     return json.dumps([annotations])
 
 def _main():
@@ -112,12 +135,12 @@ def _main():
     
     HiRes, names = _loadData(rawHiRes)
     labHiRes, _ = _loadData(labelHiRes)
-    
+
     HiResAnnot = _cocoAnnot(HiRes, labHiRes, rawHiRes, names)
-    
+
     LoRes, names = _loadData(rawLoRes)
     labLoRes, _ = _loadData(labelLoRes)
-    
+
     LoResAnnot = _cocoAnnot(LoRes, labLoRes, rawLoRes, names)
     
     with open('../HiRes/labeled/annotations.json', 'w') as file:
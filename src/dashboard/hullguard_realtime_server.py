@@ -11,9 +11,11 @@ from __future__ import annotations
 
 import asyncio
 import base64
+import concurrent.futures
 import io
 import json
 import argparse
+import threading
 from pathlib import Path
 
 try:
@@ -22,9 +24,29 @@ except Exception:
     raise
 
 from PIL import Image
+import cv2
 import numpy as np
 import torch
 
+try:
+    import onnxruntime as ort
+except Exception:  # opcional: sem onnxruntime seguimos no PyTorch eager
+    ort = None
+
+try:
+    import intel_extension_for_pytorch as ipex
+except Exception:  # opcional: sem IPEX o caminho CPU segue em FP32 puro
+    ipex = None
+
+try:
+    import torch_tensorrt as trt
+except Exception:  # opcional: sem TensorRT a GPU serve em FP16 eager
+    trt = None
+
+# vira True quando ipex.optimize(dtype=bfloat16) foi aplicado: o forward
+# em CPU passa a rodar sob autocast BF16 (AMX/AVX-512)
+_ipex_bf16 = False
+
 from vision_utils import compute_fouling_from_mask
 from train_unet import SimpleUNet
 from barnacle_detector import count_cracas_from_mask
@@ -34,6 +56,29 @@ MODEL_PATH = Path(__file__).parent.parent / "models" / "unet_best.pth"
 
 
 def load_model(path: Path):
+    # prefere o artefato INT8 quantizado (gerado por train_unet
+    # --quantize_int8): ~4x menor e convs INT8 na CPU
+    int8_path = path.parent / 'unet_int8.pt'
+    if int8_path.exists():
+        try:
+            model = torch.jit.load(str(int8_path), map_location='cpu')
+            model.eval()
+            print('Modelo INT8 carregado em', int8_path)
+            return model
+        except Exception as e:
+            print('Falha ao carregar modelo INT8, tentando o .pth:', e)
+
+    # depois, o TorchScript congelado salvo pelo train_unet
+    ts_path = path.with_suffix('.pt')
+    if ts_path.exists():
+        try:
+            model = torch.jit.load(str(ts_path), map_location='cpu')
+            model.eval()
+            print('Modelo TorchScript carregado em', ts_path)
+            return model
+        except Exception as e:
+            print('Falha ao carregar TorchScript, tentando o .pth:', e)
+
     if not path.exists():
         print("Modelo não encontrado, fallback para heurística")
         return None
@@ -51,14 +96,180 @@ def load_model(path: Path):
     except Exception:
         model.load_state_dict(state, strict=False)
     model.eval()
+
+    # Conv+BN fundidos e layout NHWC: ativa o caminho rápido do oneDNN
+    try:
+        model.fuse()
+        model = model.to(memory_format=torch.channels_last)
+    except Exception as e:
+        print('Fusão Conv+BN falhou:', e)
+
+    if torch.cuda.is_available():
+        # servidor com GPU: a U-Net é memory-bound, FP16 corta a banda de
+        # memória (e a VRAM) pela metade; o freeze abaixo ainda se aplica
+        model = model.to('cuda').half()
+        # com torch_tensorrt instalado, compila um engine fundido para os
+        # tensor cores; qualquer falha (op sem suporte, driver) cai de
+        # volta no FP16 eager acima
+        if trt is not None:
+            try:
+                dummy = torch.randn(1, in_ch, 256, 256, device='cuda', dtype=torch.half)
+                model = trt.compile(model, inputs=[dummy], enabled_precisions={torch.half})
+                print('Modelo compilado com Torch-TensorRT (FP16)')
+            except Exception as e:
+                print('Torch-TensorRT falhou, servindo FP16 eager:', e)
+    # Com onnxruntime instalado (e sem GPU), exporta o grafo uma vez e serve
+    # via ORT: elimina o dispatch Python por operação do modo eager
+    elif ort is not None:
+        try:
+            return _make_onnx_runner(model, in_ch, path)
+        except Exception as e:
+            print('Export ONNX falhou, usando PyTorch eager:', e)
+
+    # sem ONNX: IPEX reescreve as convs para os kernels oneDNN em BF16
+    # (AMX/AVX-512) quando disponível; em máquinas sem suporte o optimize
+    # lança e seguimos em FP32
+    if ipex is not None:
+        try:
+            model = ipex.optimize(model, dtype=torch.bfloat16, level='O1')
+            global _ipex_bf16
+            _ipex_bf16 = True
+            print('IPEX ativo (BF16 + oneDNN)')
+        except Exception as e:
+            print('ipex.optimize falhou, seguindo em FP32:', e)
+
+    # ao menos congela via TorchScript (funde BN nas convs e remove o
+    # interpretador Python do forward); pula optimize_for_inference,
+    # que regride em U-Nets
+    try:
+        torch.jit.enable_onednn_fusion(True)  # fusão Conv+ReLU no grafo JIT
+        model = torch.jit.freeze(torch.jit.script(model))
+    except Exception as e:
+        print('TorchScript freeze falhou, usando eager:', e)
+
     return model
 
 
+def _make_onnx_runner(model, in_ch: int, pth_path: Path):
+    """Exporta o modelo para ONNX (cacheado ao lado do .pth) e devolve um
+    callable com a mesma assinatura de model(tensor)."""
+    onnx_path = pth_path.with_suffix('.onnx')
+    if not onnx_path.exists() or onnx_path.stat().st_mtime < pth_path.stat().st_mtime:
+        torch.onnx.export(
+            model, torch.randn(1, in_ch, 256, 256), str(onnx_path),
+            opset_version=17, input_names=['input'], output_names=['logits'],
+            dynamic_axes={'input': {0: 'B'}, 'logits': {0: 'B'}},
+        )
+
+    so = ort.SessionOptions()
+    so.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    available = ort.get_available_providers()
+    providers = [p for p in ('OpenVINOExecutionProvider', 'CPUExecutionProvider')
+                 if p in available] or available
+    sess = ort.InferenceSession(str(onnx_path), sess_options=so, providers=providers)
+
+    def run(tensor: torch.Tensor) -> torch.Tensor:
+        out = sess.run(['logits'], {'input': np.ascontiguousarray(tensor.numpy())})[0]
+        return torch.from_numpy(out)
+
+    print('Servindo inferência via ONNX Runtime:', onnx_path.name, providers)
+    return run
+
+
+# Buffers de preprocess reutilizados por thread (o decode roda num
+# ThreadPoolExecutor): elimina ~2 MB de temporários por frame sem corrida
+_buffers = threading.local()
+
+
 def preprocess_pil(pil: Image.Image, target=(256, 256)) -> torch.Tensor:
-    pil = pil.convert('RGB').resize(target)
-    arr = np.array(pil).astype(np.float32) / 255.0
-    t = torch.from_numpy(arr).permute(2, 0, 1).unsqueeze(0).float()
-    return t
+    shape = (target[1], target[0], 3)
+    if getattr(_buffers, 'u8', None) is None or _buffers.u8.shape != shape:
+        _buffers.u8 = np.empty(shape, dtype=np.uint8)
+        _buffers.f32 = np.empty(shape, dtype=np.float32)
+    cv2.resize(np.asarray(pil.convert('RGB')), target, dst=_buffers.u8, interpolation=cv2.INTER_AREA)
+    np.multiply(_buffers.u8, 1.0 / 255.0, out=_buffers.f32, dtype=np.float32)
+    return torch.from_numpy(_buffers.f32).permute(2, 0, 1).unsqueeze(0)
+
+
+# Pool para decode/preprocess: base64 + JPEG + resize são CPU puro e
+# travariam todos os clientes se rodassem no event loop
+_decode_pool = concurrent.futures.ThreadPoolExecutor(max_workers=4)
+
+
+def _decode_and_preprocess(frame_b64: str):
+    frame_bytes = base64.b64decode(frame_b64)
+    pil = Image.open(io.BytesIO(frame_bytes)).convert('RGB')
+    tensor = preprocess_pil(pil, target=(256, 256))
+    # copia (em channels_last) ainda na thread do pool: o buffer
+    # thread-local pode ser reutilizado assim que esta função retorna
+    return tensor.contiguous(memory_format=torch.channels_last)
+
+
+def _decode_gray_fallback(frame_b64: str) -> np.ndarray:
+    """Decode + gray 256x256 para a heurística, sem passar pelo PIL:
+    cv2.imdecode usa o libjpeg-turbo (SIMD) e o resize/cvtColor ficam
+    numa passada C cada."""
+    frame_bytes = base64.b64decode(frame_b64)
+    bgr = cv2.imdecode(np.frombuffer(frame_bytes, np.uint8), cv2.IMREAD_COLOR)
+    if bgr is None:
+        raise ValueError('frame JPEG inválido')
+    small = cv2.resize(bgr, (256, 256), interpolation=cv2.INTER_AREA)
+    return cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+
+
+# Micro-batching entre conexões: Conv2d em CPU só enche as lanes SIMD com
+# batch >= 4. Um worker único agrega até MAX_BATCH frames (ou o que chegar
+# numa janela de 5 ms), roda um forward e devolve fatias via Future.
+MAX_BATCH = 8
+BATCH_WINDOW_S = 0.005
+
+_infer_q = None
+
+
+def _forward(model, tensors):
+    # inference_mode desliga também o version counter e o view tracking
+    # do autograd — mais barato que no_grad no caminho eager
+    with torch.inference_mode():
+        # módulos torch em GPU recebem o batch em FP16; o runner ONNX e o
+        # caminho CPU seguem em FP32
+        # despacha pelo device real dos pesos, não por cuda.is_available():
+        # os artefatos .pt (INT8/TorchScript) são carregados em CPU mesmo
+        # num host com GPU e receberiam tensores CUDA por engano
+        param = next(model.parameters(), None) if isinstance(model, torch.nn.Module) else None
+        if param is not None and param.is_cuda:
+            tensors = tensors.to('cuda', non_blocking=True)
+            if param.dtype == torch.float16:
+                tensors = tensors.half()
+            with torch.autocast('cuda', dtype=torch.float16):
+                return model(tensors)
+        if _ipex_bf16:
+            with torch.autocast('cpu', dtype=torch.bfloat16):
+                return model(tensors)
+        return model(tensors)
+
+
+async def inference_worker(model):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await _infer_q.get()
+        batch = [item]
+        try:
+            while len(batch) < MAX_BATCH:
+                batch.append(await asyncio.wait_for(_infer_q.get(), timeout=BATCH_WINDOW_S))
+        except asyncio.TimeoutError:
+            pass
+
+        tensors = torch.cat([t for t, _ in batch], dim=0)
+        try:
+            # forward fora do event loop para não travar os websockets
+            logits = await loop.run_in_executor(None, _forward, model, tensors)
+            for i, (_, fut) in enumerate(batch):
+                if not fut.done():
+                    fut.set_result(logits[i:i + 1])
+        except Exception as e:
+            for _, fut in batch:
+                if not fut.done():
+                    fut.set_exception(e)
 
 
 async def handler(websocket, path, model):
@@ -70,20 +281,23 @@ async def handler(websocket, path, model):
             if not frame_b64:
                 await websocket.send(json.dumps({'error': 'no frame'}))
                 continue
-            # decode base64
-            frame_bytes = base64.b64decode(frame_b64)
-            pil = Image.open(io.BytesIO(frame_bytes)).convert('RGB')
-            # ensure size 256x256
-            tensor = preprocess_pil(pil, target=(256, 256))
+            loop = asyncio.get_running_loop()
 
             if model is not None:
-                with torch.no_grad():
-                    logits = model(tensor)
-                    probs = torch.sigmoid(logits)[0, 0].cpu().numpy()
-                mask = (probs > 0.5).astype(np.uint8) * 255
+                # decode + preprocess fora do event loop (o tensor já volta
+                # copiado em channels_last, pronto para a fila)
+                tensor = await loop.run_in_executor(_decode_pool, _decode_and_preprocess, frame_b64)
+                fut = loop.create_future()
+                await _infer_q.put((tensor, fut))
+                logits = (await fut)[0, 0]
+                # sigmoid é monotônica: probs > 0.5 equivale a logits > 0,
+                # então o threshold sai no device e só um HxW uint8 cruza
+                # o barramento (4x menos D2H que o float32 de antes)
+                mask_t = (logits > 0).to(torch.uint8).mul_(255)
+                coverage = float(mask_t.float().mean().item()) / 255.0
+                confidence = float(torch.sigmoid(logits.float()).mean().item())
+                mask = mask_t.cpu().numpy()
                 igi = float(compute_fouling_from_mask(mask))
-                coverage = float(mask.mean() / 255.0)
-                confidence = float(np.mean(probs))
                 # count barnacles using morphology helper
                 try:
                     cr_count, fouling_px, fouling_cm2 = count_cracas_from_mask(mask, cm2_per_pixel=0.0025)
@@ -94,27 +308,35 @@ async def handler(websocket, path, model):
                     cr_count = 0
                     fouling_cm2 = 0.0
                     cr_per_cm2 = 0.0
-                # encode mask as PNG base64
-                buf = io.BytesIO()
-                Image.fromarray(mask).convert('L').save(buf, format='PNG')
-                mask_b64 = base64.b64encode(buf.getvalue()).decode('ascii')
+                # máscara vai num frame binário separado (PNG cru), sem
+                # base64 (~33% menos bytes); imencode nível 1 é ~3x mais
+                # rápido que o default do PIL
+                ok, png = cv2.imencode('.png', mask, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+                png_bytes = png.tobytes() if ok else None
                 resp = {
                     'igi': igi,
                     'coverage': coverage,
                     'confidence': confidence,
-                    'mask': mask_b64,
+                    'mask_binary': png_bytes is not None,
                     'cracas': cr_count,
                     'cracas_per_cm2': cr_per_cm2,
                     'fouling_cm2': fouling_cm2,
                 }
             else:
                 # fallback heuristic: use simple brightness/edges
-                arr = np.array(pil.resize((256, 256)).convert('L'))
-                edge = np.mean(np.abs(np.gradient(arr.astype(float), axis=0))) / 255.0
-                igi = float(edge)
-                resp = {'igi': igi, 'coverage': 0.0, 'confidence': 0.5}
+                # Sobel separável SIMD no uint8 direto, em vez do
+                # np.gradient float64 (que aloca HxW em dobro)
+                gray = await loop.run_in_executor(_decode_pool, _decode_gray_fallback, frame_b64)
+                gx = cv2.Sobel(gray, cv2.CV_32F, 0, 1, ksize=3)
+                igi = float(np.abs(gx).mean() / 255.0)
+                png_bytes = None
+                resp = {'igi': igi, 'coverage': 0.0, 'confidence': 0.5, 'mask_binary': False}
 
+            # websockets despacha por tipo: str -> text, bytes -> binary;
+            # o cliente distingue Blob de string no onmessage
             await websocket.send(json.dumps(resp))
+            if png_bytes is not None:
+                await websocket.send(png_bytes)
 
         except Exception as e:
             print('Error handling frame:', e)
@@ -133,6 +355,11 @@ async def main(host: str = '0.0.0.0', port: int = 8501):
     except Exception as e:
         print('Falha ao carregar modelo:', e)
 
+    global _infer_q
+    _infer_q = asyncio.Queue()
+    if model is not None:
+        asyncio.create_task(inference_worker(model))
+
     async def _handler(ws, path):
         await handler(ws, path, model)
 
@@ -29,7 +29,7 @@ from torch.utils.data import Dataset, DataLoader
 import torchvision.transforms as T
 
 from vision_utils import coco_annotations_to_masks, apply_frequency_bandpass, compute_fouling_from_mask
-from barnacle_detector import count_cracas_from_mask
+from barnacle_detector import count_cracas_batch
 
 
 class SimpleUNet(nn.Module):
@@ -82,8 +82,12 @@ class SimpleUNet(nn.Module):
 
         x = self.bottleneck(x)
 
-        # decode
-        for upconv, dec, skip in zip(self.upconvs, self.decs, reversed(skips)):
+        # decode (índice explícito no skip: reversed(List[Tensor]) não é
+        # scriptable, e sem script não há freeze nem quantização INT8)
+        i = len(skips) - 1
+        for upconv, dec in zip(self.upconvs, self.decs):
+            skip = skips[i]
+            i -= 1
             x = upconv(x)
             # ensure same spatial size
             if x.shape[2:] != skip.shape[2:]:
@@ -93,6 +97,21 @@ class SimpleUNet(nn.Module):
 
         return self.final(x)
 
+    @torch.no_grad()
+    def fuse(self):
+        """Funde Conv+BN (modo eval) em cada double_conv: o BN vira afim
+        dentro do Conv e metade das ativações deixa de ir à RAM. Chamar
+        apenas depois de model.eval()."""
+        from torch.nn.utils.fusion import fuse_conv_bn_eval
+
+        for mod in self.modules():
+            if isinstance(mod, nn.Sequential) and len(mod) == 6 and isinstance(mod[0], nn.Conv2d):
+                mod[0] = fuse_conv_bn_eval(mod[0], mod[1])
+                mod[1] = nn.Identity()
+                mod[3] = fuse_conv_bn_eval(mod[3], mod[4])
+                mod[4] = nn.Identity()
+        return self
+
 
 class BarnacleDataset(Dataset):
     def __init__(self, images_dir, masks_dir, size=(256, 256), use_freq=False):
@@ -129,16 +148,57 @@ class BarnacleDataset(Dataset):
         mask_t = self.transform_mask(mask)
 
         if self.use_freq:
-            # produce frequency-filtered grayscale channel and append
-            img_np = np.array(img.resize(self.size)).astype(np.uint8)
-            freq = apply_frequency_bandpass(img_np.mean(axis=2).astype(np.float32), low_ratio=0.01, high_ratio=0.5)
-            freq = Image.fromarray(freq.astype(np.uint8)).convert('L')
-            freq_t = T.ToTensor()(freq)
+            # produce frequency-filtered grayscale channel and append;
+            # o gray sai do tensor já redimensionado (sem o segundo
+            # img.resize nem o roundtrip Image.fromarray + ToTensor)
+            gray = img_t.mean(dim=0).numpy() * 255.0
+            freq = apply_frequency_bandpass(gray.astype(np.float32, copy=False), low_ratio=0.01, high_ratio=0.5)
+            freq_t = torch.from_numpy(freq / 255.0).unsqueeze(0).float()
             img_t = torch.cat([img_t, freq_t], dim=0)
 
         return img_t, mask_t
 
 
+def quantize_int8(model, loader, save_path, max_batches=50):
+    """Quantização estática pós-treino (INT8, backend fbgemm) para CPU.
+
+    Funde Conv+BN+ReLU de cada double_conv, calibra as ativações com alguns
+    batches do loader e salva um módulo TorchScript quantizado (~4x menor,
+    convs em GEMM INT8/AVX2).
+    """
+    import copy
+    import torch.quantization as tq
+
+    qmodel = tq.QuantWrapper(copy.deepcopy(model).cpu().eval())
+    # cada double_conv é um Sequential [Conv,BN,ReLU,Conv,BN,ReLU]
+    for mod in qmodel.modules():
+        if isinstance(mod, nn.Sequential) and len(mod) == 6 and isinstance(mod[0], nn.Conv2d):
+            tq.fuse_modules(mod, [['0', '1', '2'], ['3', '4', '5']], inplace=True)
+
+    qmodel.qconfig = tq.get_default_qconfig('fbgemm')
+    # o observador de peso por canal do fbgemm não suporta ConvTranspose2d:
+    # os upconvs quantizam com observador por tensor
+    per_tensor = tq.QConfig(
+        activation=qmodel.qconfig.activation,
+        weight=tq.default_weight_observer,
+    )
+    for mod in qmodel.modules():
+        if isinstance(mod, nn.ConvTranspose2d):
+            mod.qconfig = per_tensor
+    tq.prepare(qmodel, inplace=True)
+
+    # calibração: passa frames reais para observar os ranges de ativação
+    with torch.no_grad():
+        for bi, (imgs, _) in enumerate(loader):
+            qmodel(imgs.float())
+            if bi + 1 >= max_batches:
+                break
+
+    tq.convert(qmodel, inplace=True)
+    torch.jit.save(torch.jit.script(qmodel), str(save_path))
+    return save_path
+
+
 def train(args):
     # ensure masks exist
     if args.coco and (not Path(args.out_masks).exists() or args.force_masks):
@@ -149,8 +209,14 @@ def train(args):
     ds = BarnacleDataset(args.images, args.out_masks, size=tuple(args.size), use_freq=args.use_freq)
     val_ds = ds  # for simplicity; user can pass separate valid folders
 
-    train_loader = DataLoader(ds, batch_size=args.batch_size, shuffle=True, num_workers=0)
-    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, num_workers=0)
+    # workers persistentes: decode PIL + bandpass do use_freq rodam em
+    # paralelo com o forward/backward, em vez de serializar no processo
+    # principal (o dataset guarda só caminhos, então o fork é barato)
+    n_workers = max(1, (os.cpu_count() or 2) // 2)
+    loader_kw = dict(num_workers=n_workers, persistent_workers=True,
+                     pin_memory=torch.cuda.is_available(), prefetch_factor=4)
+    train_loader = DataLoader(ds, batch_size=args.batch_size, shuffle=True, **loader_kw)
+    val_loader = DataLoader(val_ds, batch_size=args.batch_size, shuffle=False, **loader_kw)
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
@@ -166,8 +232,8 @@ def train(args):
         model.train()
         running = 0.0
         for imgs, masks in train_loader:
-            imgs = imgs.to(device, dtype=torch.float32)
-            masks = masks.to(device, dtype=torch.float32)
+            imgs = imgs.to(device, dtype=torch.float32, non_blocking=True)
+            masks = masks.to(device, dtype=torch.float32, non_blocking=True)
             masks = (masks > 0.5).float()
 
             logits = model(imgs)
@@ -190,32 +256,30 @@ def train(args):
         total_fouling_cm2_pred = 0.0
         total_fouling_cm2_gt = 0.0
         total_pixels = 0
-        with torch.no_grad():
+        with torch.inference_mode():
             for imgs, masks in val_loader:
-                imgs = imgs.to(device, dtype=torch.float32)
-                masks = masks.to(device, dtype=torch.float32)
+                imgs = imgs.to(device, dtype=torch.float32, non_blocking=True)
+                masks = masks.to(device, dtype=torch.float32, non_blocking=True)
                 masks = (masks > 0.5).float()
                 logits = model(imgs)
                 loss = criterion(logits, masks)
                 vrun += loss.item() * imgs.size(0)
 
-                # compute barnacle KPIs on predictions and ground truth
-                probs = torch.sigmoid(logits).cpu().numpy()
-                preds = (probs > 0.5).astype(np.uint8)  # B,1,H,W
-                gts = masks.cpu().numpy().astype(np.uint8)
-
-                B = preds.shape[0]
-                for i in range(B):
-                    pred_mask = preds[i, 0]
-                    gt_mask = gts[i, 0]
-                    # count cracas and area
-                    cr_pred, fouling_px_pred, fouling_cm2_pred = count_cracas_from_mask(pred_mask, cm2_per_pixel=0.0025, area_px_min=20, area_px_max=2000)
-                    cr_gt, fouling_px_gt, fouling_cm2_gt = count_cracas_from_mask(gt_mask, cm2_per_pixel=0.0025, area_px_min=20, area_px_max=2000)
-                    total_cracas_pred += cr_pred
-                    total_cracas_gt += cr_gt
-                    total_fouling_cm2_pred += fouling_cm2_pred
-                    total_fouling_cm2_gt += fouling_cm2_gt
-                    total_pixels += pred_mask.size
+                # compute barnacle KPIs on predictions and ground truth;
+                # sigmoid é monotônica (probs > 0.5 == logits > 0), então o
+                # threshold sai no device e só uint8 atravessa o D2H
+                preds = (logits > 0).to(torch.uint8).cpu().numpy()  # B,1,H,W
+                gts = masks.to(torch.uint8).cpu().numpy()
+
+                # KPIs do batch inteiro numa chamada (scipy.ndimage.label
+                # rotula as B máscaras numa só passada C)
+                cr_pred, _, cm2_pred = count_cracas_batch(preds[:, 0], cm2_per_pixel=0.0025, area_px_min=20, area_px_max=2000)
+                cr_gt, _, cm2_gt = count_cracas_batch(gts[:, 0], cm2_per_pixel=0.0025, area_px_min=20, area_px_max=2000)
+                total_cracas_pred += int(cr_pred.sum())
+                total_cracas_gt += int(cr_gt.sum())
+                total_fouling_cm2_pred += float(cm2_pred.sum())
+                total_fouling_cm2_gt += float(cm2_gt.sum())
+                total_pixels += preds[:, 0].size
         vloss = vrun / len(val_ds)
         print(f"  val loss: {vloss:.4f}")
 
@@ -233,6 +297,24 @@ def train(args):
             torch.save({'model_state': model.state_dict(), 'args': vars(args)}, out_path)
             print("  Saved best model ->", out_path)
 
+    # artefato TorchScript congelado para o servidor: BN constant-folded
+    # nas convs e forward sem dispatch Python por op
+    try:
+        out_ts = Path(args.save_dir) / 'unet_best.pt'
+        frozen = torch.jit.freeze(torch.jit.script(model.cpu().eval()))
+        torch.jit.save(frozen, str(out_ts))
+        print('TorchScript congelado salvo ->', out_ts)
+    except Exception as e:
+        print('Export TorchScript falhou (seguindo só com o .pth):', e)
+
+    if args.quantize_int8:
+        try:
+            out_q = Path(args.save_dir) / 'unet_int8.pt'
+            quantize_int8(model.cpu().eval(), val_loader, out_q)
+            print('Modelo INT8 salvo ->', out_q)
+        except Exception as e:
+            print('Quantização INT8 falhou (seguindo só com o .pth):', e)
+
 
 def parse_args():
     p = argparse.ArgumentParser()
@@ -246,6 +328,7 @@ def parse_args():
     p.add_argument('--use_freq', action='store_true', help='Append frequency channel')
     p.add_argument('--save_dir', type=str, default='models')
     p.add_argument('--force_masks', action='store_true', help='Force regeneration of masks')
+    p.add_argument('--quantize_int8', action='store_true', help='Exporta também um TorchScript INT8 (fbgemm) para inferência em CPU')
     return p.parse_args()
 
 